@@ -9,6 +9,7 @@ class DatabaseConnection:
         load_dotenv()
         self.conn = None
         self.cursor = None
+        self.last_error = None
         self.db_params = {
             'dbname': os.getenv('DB_NAME', 'car_service'),
             'user': os.getenv('DB_USER', 'postgres'),
@@ -47,6 +48,7 @@ class DatabaseConnection:
             self.conn.commit()
             return True
         except Error as e:
+            self.last_error = e
             print(f"Query execution error: {e}")
             self.conn.rollback()
             return False
@@ -60,6 +62,7 @@ class DatabaseConnection:
                 self.cursor.execute(query)
             return self.cursor.fetchall()
         except Error as e:
+            self.last_error = e
             print(f"Fetch error: {e}")
             return []
 
@@ -72,6 +75,7 @@ class DatabaseConnection:
                 self.cursor.execute(query)
             return self.cursor.fetchone()
         except Error as e:
+            self.last_error = e
             print(f"Fetch error: {e}")
             return None
 
@@ -239,6 +243,7 @@ class DatabaseConnection:
             self.conn.commit()
             return True
         except Error as e:
+            self.last_error = e
             self.conn.rollback()
             print(f"Error adding customer: {e}")
             return False
@@ -279,6 +284,7 @@ class DatabaseConnection:
             self.conn.commit()
             return True
         except Error as e:
+            self.last_error = e
             self.conn.rollback()
             print(f"Error adding staff: {e}")
             return False
@@ -0,0 +1,542 @@
+"""Headless soak test: N concurrent clerks hammering DatabaseConnection.
+
+Each clerk owns its own DatabaseConnection and runs a weighted random mix of
+operations for a fixed duration. A monitor connection samples pg_stat_activity
+and pg_locks to measure how long clerks spend waiting on locks.
+
+Example:
+    python load_test.py --clerks 16 --duration 60 \\
+        --mix add_customer=4,add_car=2,get_customers=3,delete_customer=1
+
+Rows created by the soak test use the @soak.test email domain, and soak cars
+are those owned by soak customers; delete operations only ever target those
+rows, and --cleanup removes them afterwards. Emails carry a per-run token, so
+unique violations count only collisions within the current run, but rows left
+behind by runs without --cleanup still grow the tables and skew later runs.
+"""
+import argparse
+import contextlib
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set
+
+from psycopg2 import Error, errorcodes
+
+from database_connection import DatabaseConnection
+
+APPLICATION_NAME = 'car_service_soak'
+EMAIL_DOMAIN = '@soak.test'
+
+DEFAULT_MIX = ('add_customer=4,add_car=2,add_staff=1,get_customers=3,'
+               'get_cars=2,get_staff=1,delete_customer=1,delete_car=1,delete_staff=1')
+
+# Outcome of a delete whose row was already gone, e.g. removed by another clerk
+NOT_FOUND = 'not_found'
+
+ERROR_CLASSES = {
+    errorcodes.DEADLOCK_DETECTED: 'deadlock',
+    errorcodes.SERIALIZATION_FAILURE: 'serialization_failure',
+    errorcodes.LOCK_NOT_AVAILABLE: 'lock_not_available',
+    errorcodes.UNIQUE_VIOLATION: 'unique_violation',
+    errorcodes.FOREIGN_KEY_VIOLATION: 'foreign_key_violation',
+    errorcodes.IN_FAILED_SQL_TRANSACTION: 'in_failed_transaction',
+}
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """Parse 'op=weight,op=weight' into a dict of operation weights"""
+    mix = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(
+                f"Unknown operation '{name}'. Choose from: {', '.join(sorted(OPERATIONS))}")
+        try:
+            mix[name] = int(weight) if weight else 1
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid weight for '{name}': {weight}")
+        if mix[name] < 0:
+            raise argparse.ArgumentTypeError(f"Weight for '{name}' must not be negative")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("Operation mix must contain a positive weight")
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = min(max(1, math.ceil(pct / 100.0 * len(sorted_values))), len(sorted_values))
+    return sorted_values[rank - 1]
+
+
+def classify_error(error: Optional[Exception]) -> str:
+    """Map a psycopg2 error to a short category name"""
+    if error is None:
+        return 'unknown'
+    code = getattr(error, 'pgcode', None)
+    if code is None:
+        return type(error).__name__
+    category = ERROR_CLASSES.get(code, f'sqlstate_{code}')
+    if code == errorcodes.UNIQUE_VIOLATION:
+        # Tell the Contact.email race apart from Identity.id_number and the rest
+        constraint = getattr(getattr(error, 'diag', None), 'constraint_name', None)
+        if constraint:
+            category = f'{category}:{constraint}'
+    return category
+
+
+class SharedState:
+    """Pool of soak-owned row ids shared by all clerks"""
+
+    def __init__(self, email_pool: int):
+        self.lock = threading.Lock()
+        self.email_pool = email_pool
+        self.run_token = uuid.uuid4().hex[:8]
+        self.customer_ids: List[int] = []
+        self.car_ids: List[int] = []
+        self.staff_ids: List[int] = []
+
+    def refresh(self, attr: str, ids: List[int]):
+        with self.lock:
+            setattr(self, attr, ids)
+
+    def snapshot(self, attr: str) -> Set[int]:
+        with self.lock:
+            return set(getattr(self, attr))
+
+    def pick(self, attr: str, rng: random.Random) -> Optional[int]:
+        with self.lock:
+            ids = getattr(self, attr)
+            return rng.choice(ids) if ids else None
+
+    def forget(self, attr: str, row_id: int):
+        with self.lock:
+            ids = getattr(self, attr)
+            if row_id in ids:
+                ids.remove(row_id)
+
+
+def soak_email(state: SharedState, rng: random.Random, kind: str) -> str:
+    # A bounded pool makes concurrent adds collide on Contact.email on purpose;
+    # the run token keeps rows from earlier runs out of the collision count
+    return f"{kind}{rng.randrange(state.email_pool)}.{state.run_token}{EMAIL_DOMAIN}"
+
+
+def op_add_customer(db: DatabaseConnection, state: SharedState, rng: random.Random) -> bool:
+    return db.add_customer("Soak", f"Customer{rng.randrange(10000)}", soak_email(state, rng, 'customer'))
+
+
+def op_add_staff(db: DatabaseConnection, state: SharedState, rng: random.Random) -> bool:
+    return db.add_staff("Soak", f"Staff{rng.randrange(10000)}", "Clerk",
+                        soak_email(state, rng, 'staff'), "1 Load Test Lane")
+
+
+def op_add_car(db: DatabaseConnection, state: SharedState, rng: random.Random) -> Optional[bool]:
+    customer_id = state.pick('customer_ids', rng)
+    if customer_id is None:
+        return None
+    plate = f"SOAK{uuid.UUID(int=rng.getrandbits(128)).hex[:8].upper()}"
+    return db.add_car("Model", "Soak", plate, customer_id)
+
+
+def load_customer_ids(db: DatabaseConnection, state: SharedState):
+    rows = db.get_customers()
+    state.refresh('customer_ids', [row[0] for row in rows if row[3].endswith(EMAIL_DOMAIN)])
+
+
+def load_car_ids(db: DatabaseConnection, state: SharedState):
+    rows = db.get_cars()
+    # Plates are not a safe marker (real plates may share any prefix), owners are
+    soak_customers = state.snapshot('customer_ids')
+    state.refresh('car_ids', [row[0] for row in rows if row[4] in soak_customers])
+
+
+def load_staff_ids(db: DatabaseConnection, state: SharedState):
+    rows = db.get_staff()
+    state.refresh('staff_ids', [row[0] for row in rows if row[4].endswith(EMAIL_DOMAIN)])
+
+
+def op_get_customers(db: DatabaseConnection, state: SharedState, rng: random.Random) -> bool:
+    load_customer_ids(db, state)
+    return db.last_error is None
+
+
+def op_get_cars(db: DatabaseConnection, state: SharedState, rng: random.Random) -> bool:
+    load_car_ids(db, state)
+    return db.last_error is None
+
+
+def op_get_staff(db: DatabaseConnection, state: SharedState, rng: random.Random) -> bool:
+    load_staff_ids(db, state)
+    return db.last_error is None
+
+
+def _delete(attr: str, method: str):
+    def op(db: DatabaseConnection, state: SharedState, rng: random.Random):
+        row_id = state.pick(attr, rng)
+        if row_id is None:
+            return None
+        ok = getattr(db, method)(row_id)
+        if ok:
+            state.forget(attr, row_id)
+            if db.cursor.rowcount == 0:
+                return NOT_FOUND
+        return ok
+    return op
+
+
+OPERATIONS = {
+    'add_customer': op_add_customer,
+    'add_car': op_add_car,
+    'add_staff': op_add_staff,
+    'get_customers': op_get_customers,
+    'get_cars': op_get_cars,
+    'get_staff': op_get_staff,
+    'delete_customer': _delete('customer_ids', 'delete_customer'),
+    'delete_car': _delete('car_ids', 'delete_car'),
+    'delete_staff': _delete('staff_ids', 'delete_staff'),
+}
+
+
+class ClerkStats:
+    """Per-clerk results, merged after the run so clerks never share a lock"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.successes: Counter = Counter()
+        self.failures: Dict[str, Counter] = defaultdict(Counter)
+        self.skipped: Counter = Counter()
+        self.not_found: Counter = Counter()
+        self.exited_early = False
+
+
+def run_clerk(state: SharedState, mix: Dict[str, int], rng: random.Random, stop: threading.Event,
+              ready: threading.Barrier, stats: ClerkStats):
+    """Run random operations from the mix until the stop event is set"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    db = DatabaseConnection()
+    db.db_params['application_name'] = APPLICATION_NAME
+    connected = db.connect()
+    ready.wait()
+    if not connected:
+        stats.failures['connect']['connection_error'] += 1
+        stats.exited_early = True
+        return
+    try:
+        while not stop.is_set():
+            name = rng.choices(names, weights)[0]
+            db.last_error = None
+            start = time.perf_counter()
+            try:
+                ok = OPERATIONS[name](db, state, rng)
+            except Error as e:
+                # e.g. rollback() on a backend the server already dropped
+                if db.conn.closed:
+                    stats.failures[name]['connection_lost'] += 1
+                    stats.exited_early = True
+                    break
+                stats.failures[name][classify_error(e)] += 1
+                continue
+            except Exception as e:
+                stats.failures[name][type(e).__name__] += 1
+                stats.exited_early = True
+                break
+            elapsed = time.perf_counter() - start
+            if ok is None:
+                stats.skipped[name] += 1
+                continue
+            if ok == NOT_FOUND:
+                # No-op deletes would flatter delete latency, so keep them apart
+                stats.not_found[name] += 1
+                continue
+            stats.latencies[name].append(elapsed)
+            if ok:
+                stats.successes[name] += 1
+            else:
+                stats.failures[name][classify_error(db.last_error)] += 1
+    finally:
+        db.close()
+
+
+class PoolRefresher(threading.Thread):
+    """Keep the shared id pools filled outside the measured operation mix
+
+    Without this, deletes and add_car only find rows when the mix also
+    contains the matching get_* operations.
+    """
+
+    def __init__(self, state: SharedState, interval: float):
+        super().__init__(daemon=True)
+        self.state = state
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.db = DatabaseConnection()
+
+    def start_refreshing(self) -> bool:
+        if not self.db.connect():
+            return False
+        # Autocommit so the refresher never sits idle in a transaction
+        self.db.conn.autocommit = True
+        self.refresh()
+        self.start()
+        return True
+
+    def refresh(self):
+        # Customers first: the car pool is filtered by soak owners
+        load_customer_ids(self.db, self.state)
+        load_car_ids(self.db, self.state)
+        load_staff_ids(self.db, self.state)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.refresh()
+
+    def stop_refreshing(self):
+        self.stop_event.set()
+        self.join()
+        self.db.close()
+
+
+class LockMonitor(threading.Thread):
+    """Sample lock waits of soak clerks from pg_stat_activity and pg_locks"""
+
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.db = DatabaseConnection()
+        self.samples = 0
+        self.waiting_samples = 0
+        self.lock_wait_seconds = 0.0
+        self.max_waiting = 0
+        self.max_wait_seconds = 0.0
+        self.wait_modes: Counter = Counter()
+        self.deadlocks_start = None
+        self.deadlocks_end = None
+        # Replaced with pg_locks.waitstart once the server version is known
+        self.wait_start = 'a.query_start'
+
+    def start_monitoring(self) -> bool:
+        if not self.db.connect():
+            return False
+        # Autocommit so every sample sees a fresh now() and no snapshot is held
+        self.db.conn.autocommit = True
+        self.deadlocks_start = self._deadlock_count()
+        version = self.db.fetch_one("SHOW server_version_num")
+        # pg_locks.waitstart only exists from PostgreSQL 14 onwards
+        self.wait_start = 'COALESCE(l.waitstart, a.query_start)' \
+            if version and int(version[0]) >= 140000 else 'a.query_start'
+        self.start()
+        return True
+
+    def _deadlock_count(self) -> Optional[int]:
+        row = self.db.fetch_one(
+            "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        return row[0] if row else None
+
+    def run(self):
+        query = f"""
+            SELECT l.mode, EXTRACT(EPOCH FROM now() - {self.wait_start})
+            FROM pg_locks l
+            JOIN pg_stat_activity a ON a.pid = l.pid
+            WHERE NOT l.granted AND a.application_name = %s
+        """
+        while not self.stop_event.wait(self.interval):
+            rows = self.db.fetch_all(query, (APPLICATION_NAME,))
+            self.samples += 1
+            if not rows:
+                continue
+            self.waiting_samples += 1
+            # Each waiting backend is assumed to have waited the whole interval
+            self.lock_wait_seconds += len(rows) * self.interval
+            self.max_waiting = max(self.max_waiting, len(rows))
+            for mode, waited in rows:
+                self.wait_modes[mode] += 1
+                self.max_wait_seconds = max(self.max_wait_seconds, float(waited or 0))
+
+    def stop_monitoring(self):
+        self.stop_event.set()
+        self.join()
+        self.deadlocks_end = self._deadlock_count()
+        self.db.close()
+
+
+def cleanup():
+    """Remove every row created by previous soak runs"""
+    db = DatabaseConnection()
+    if not db.connect():
+        return False
+    try:
+        like = f"%{EMAIL_DOMAIN}"
+        # Identity cascades to Customer and its cars, Contact to Staff and the rest
+        steps = [
+            ("Identity", """
+                DELETE FROM Identity WHERE id_number IN (
+                    SELECT 'ID' || contact_id FROM Contact WHERE email LIKE %s
+                )
+            """),
+            ("Contact", "DELETE FROM Contact WHERE email LIKE %s"),
+        ]
+        for table, query in steps:
+            if not db.execute_query(query, (like,)):
+                print(f"Soak test cleanup failed while deleting from {table}")
+                return False
+        print("Soak test data removed")
+        return True
+    finally:
+        db.close()
+
+
+def print_report(duration: float, clerks: int, results: List[ClerkStats], monitor: Optional[LockMonitor]):
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    successes: Counter = Counter()
+    failures: Dict[str, Counter] = defaultdict(Counter)
+    skipped: Counter = Counter()
+    not_found: Counter = Counter()
+    for stats in results:
+        for name, values in stats.latencies.items():
+            latencies[name].extend(values)
+        successes.update(stats.successes)
+        skipped.update(stats.skipped)
+        not_found.update(stats.not_found)
+        for name, counter in stats.failures.items():
+            failures[name].update(counter)
+
+    total_ops = sum(len(values) for values in latencies.values())
+    total_failed = sum(sum(counter.values()) for counter in failures.values())
+    print(f"\nSoak test: {clerks} clerks for {duration:.1f}s")
+    exited = sum(1 for stats in results if stats.exited_early)
+    if exited:
+        print(f"WARNING: {exited} of {clerks} clerks stopped before the end of the run")
+    print(f"Operations: {total_ops}  ({total_ops / duration:.1f} ops/s), "
+          f"failed: {total_failed}, skipped (no soak rows yet): {sum(skipped.values())}, "
+          f"deletes of already-removed rows: {sum(not_found.values())}")
+
+    header = f"{'operation':<16}{'ops':>8}{'ops/s':>9}{'ok':>8}{'fail':>7}{'miss':>7}{'skip':>7}" \
+             f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    print("\n" + header)
+    print("-" * len(header))
+    for name in sorted(set(latencies) | set(failures) | set(not_found) | set(skipped)):
+        values = sorted(latencies.get(name, []))
+        failed = sum(failures[name].values()) if name in failures else 0
+        print(f"{name:<16}{len(values):>8}{len(values) / duration:>9.1f}{successes[name]:>8}{failed:>7}{not_found[name]:>7}{skipped[name]:>7}"
+              f"{percentile(values, 50) * 1000:>9.1f}{percentile(values, 95) * 1000:>9.1f}"
+              f"{percentile(values, 99) * 1000:>9.1f}{(values[-1] if values else 0) * 1000:>9.1f}")
+
+    error_totals: Counter = Counter()
+    for counter in failures.values():
+        error_totals.update(counter)
+    print("\nFailures by cause:")
+    if not error_totals:
+        print("  none")
+    for cause, count in error_totals.most_common():
+        by_op = ", ".join(f"{name}={failures[name][cause]}" for name in sorted(failures) if failures[name][cause])
+        print(f"  {cause:<40}{count:>7}  ({by_op})")
+    print(f"  deadlocks reported to clerks:  {error_totals['deadlock']}")
+    print(f"  serialization failures:        {error_totals['serialization_failure']}")
+
+    if monitor is None:
+        return
+    print("\nLock contention (sampled every "
+          f"{monitor.interval * 1000:.0f} ms from pg_stat_activity/pg_locks):")
+    if monitor.deadlocks_start is not None and monitor.deadlocks_end is not None:
+        print(f"  server deadlocks (pg_stat_database): {monitor.deadlocks_end - monitor.deadlocks_start}")
+    share = monitor.waiting_samples / monitor.samples * 100 if monitor.samples else 0.0
+    print(f"  samples with waiters:  {monitor.waiting_samples}/{monitor.samples} ({share:.1f}%)")
+    print(f"  est. total lock wait:  {monitor.lock_wait_seconds:.2f}s "
+          f"({monitor.lock_wait_seconds / (duration * clerks) * 100:.1f}% of clerk time)")
+    print(f"  max concurrent waiters: {monitor.max_waiting}")
+    print(f"  longest observed wait:  {monitor.max_wait_seconds * 1000:.1f} ms")
+    if monitor.wait_modes:
+        modes = ", ".join(f"{mode}={count}" for mode, count in monitor.wait_modes.most_common())
+        print(f"  waited-for lock modes:  {modes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent multi-clerk soak test for the car service database")
+    parser.add_argument('--clerks', type=int, default=8, help="number of concurrent clerks (default: 8)")
+    parser.add_argument('--duration', type=float, default=30.0, help="run time in seconds (default: 30)")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"weighted operation mix (default: {DEFAULT_MIX})")
+    parser.add_argument('--email-pool', type=int, default=2000,
+                        help="distinct emails per kind; smaller pools force more UNIQUE collisions (default: 2000)")
+    parser.add_argument('--sample-interval', type=float, default=0.1,
+                        help="lock monitor sampling interval in seconds (default: 0.1)")
+    parser.add_argument('--refresh-interval', type=float, default=1.0,
+                        help="seconds between reloads of the soak row ids used by deletes and add_car (default: 1)")
+    parser.add_argument('--seed', type=int,
+                        help="seed for the per-clerk random generators; the interleaving still depends on timing")
+    parser.add_argument('--no-monitor', action='store_true', help="skip pg_stat_activity/pg_locks sampling")
+    parser.add_argument('--verbose', action='store_true', help="show per-operation error messages")
+    parser.add_argument('--cleanup', action='store_true',
+                        help="remove soak test rows after the run; leftover rows skew later runs")
+    args = parser.parse_args()
+
+    if args.clerks < 1 or args.duration <= 0 or args.email_pool < 1 or args.refresh_interval <= 0:
+        parser.error("--clerks, --duration, --email-pool and --refresh-interval must be positive")
+
+    setup = DatabaseConnection()
+    if not setup.connect() or not setup.create_tables():
+        return 1
+    setup.close()
+
+    state = SharedState(args.email_pool)
+    stop = threading.Event()
+    ready = threading.Barrier(args.clerks + 1)
+    results = [ClerkStats() for _ in range(args.clerks)]
+    # Seeded here so clerk N always gets the same seed, whatever the thread start order
+    seed_rng = random.Random(args.seed)
+    rngs = [random.Random(seed_rng.random()) for _ in results]
+    threads = [threading.Thread(target=run_clerk, args=(state, args.mix, rng, stop, ready, stats), daemon=True)
+               for rng, stats in zip(rngs, results)]
+
+    refresher = PoolRefresher(state, args.refresh_interval)
+    if not refresher.start_refreshing():
+        return 1
+    monitor = None if args.no_monitor else LockMonitor(args.sample_interval)
+    if monitor is not None and not monitor.start_monitoring():
+        return 1
+
+    # DatabaseConnection prints every failed query; keep the report readable
+    with open(os.devnull, 'w') as devnull, \
+            (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+        for thread in threads:
+            thread.start()
+        ready.wait()
+        started = time.perf_counter()
+        interrupted = False
+        try:
+            time.sleep(args.duration)
+        except KeyboardInterrupt:
+            # Still stop the clerks, report and clean up what ran so far
+            interrupted = True
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    refresher.stop_refreshing()
+    if monitor is not None:
+        monitor.stop_monitoring()
+    if interrupted:
+        print(f"\nInterrupted after {elapsed:.1f}s; reporting partial results")
+    print_report(elapsed, args.clerks, results, monitor)
+
+    if args.cleanup and not cleanup():
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
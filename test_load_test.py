@@ -0,0 +1,180 @@
+import argparse
+import random
+import threading
+
+import pytest
+from psycopg2 import InterfaceError, errorcodes
+
+import load_test
+from load_test import (NOT_FOUND, ClerkStats, PoolRefresher, SharedState, classify_error,
+                       cleanup, load_car_ids, load_customer_ids, parse_mix, percentile, run_clerk)
+
+
+class FakeDiag:
+    def __init__(self, constraint_name=None):
+        self.constraint_name = constraint_name
+
+
+class FakePgError(Exception):
+    def __init__(self, pgcode, constraint_name=None):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+        self.diag = FakeDiag(constraint_name)
+
+
+class FakeCursor:
+    rowcount = 1
+
+
+class FakeConn:
+    closed = 0
+    autocommit = False
+
+
+class FakeDatabaseConnection:
+    """Stands in for DatabaseConnection; each test sets the results it needs"""
+
+    customers = []
+    cars = []
+    staff = []
+    query_results = []
+
+    def __init__(self):
+        self.db_params = {}
+        self.cursor = FakeCursor()
+        self.conn = FakeConn()
+        self.last_error = None
+        self.queries = []
+
+    def connect(self):
+        return True
+
+    def close(self):
+        pass
+
+    def execute_query(self, query, params=None):
+        self.queries.append(query)
+        return self.query_results.pop(0)
+
+    def get_customers(self):
+        return self.customers
+
+    def get_cars(self):
+        return self.cars
+
+    def get_staff(self):
+        return self.staff
+
+    def delete_customer(self, customer_id):
+        return True
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    monkeypatch.setattr(load_test, 'DatabaseConnection', FakeDatabaseConnection)
+    return FakeDatabaseConnection
+
+
+def test_parse_mix_weights():
+    assert parse_mix("add_customer=4, get_cars , delete_car=0") == {
+        'add_customer': 4, 'get_cars': 1, 'delete_car': 0}
+
+
+@pytest.mark.parametrize("spec", [
+    "launch_rocket=1",
+    "add_customer=-1",
+    "add_customer=abc",
+    "add_customer=0,get_cars=0",
+    "",
+])
+def test_parse_mix_rejects_invalid(spec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_mix(spec)
+
+
+def test_percentile_nearest_rank():
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
+    assert percentile(list(range(1, 151)), 99) == 149
+    assert percentile([1, 2, 3, 4, 5], 100) == 5
+    assert percentile([7], 0) == 7
+    assert percentile([], 95) == 0.0
+
+
+def test_classify_error():
+    assert classify_error(FakePgError(errorcodes.DEADLOCK_DETECTED)) == 'deadlock'
+    assert classify_error(FakePgError(errorcodes.SERIALIZATION_FAILURE)) == 'serialization_failure'
+    assert classify_error(FakePgError(errorcodes.UNIQUE_VIOLATION)) == 'unique_violation'
+    assert classify_error(FakePgError('XX000')) == 'sqlstate_XX000'
+    assert classify_error(ValueError("no code")) == 'ValueError'
+    assert classify_error(None) == 'unknown'
+
+
+def test_classify_error_names_unique_constraint():
+    email = FakePgError(errorcodes.UNIQUE_VIOLATION, 'contact_email_key')
+    identity = FakePgError(errorcodes.UNIQUE_VIOLATION, 'identity_id_number_key')
+    assert classify_error(email) == 'unique_violation:contact_email_key'
+    assert classify_error(identity) == 'unique_violation:identity_id_number_key'
+    # Only unique violations are split by constraint
+    assert classify_error(FakePgError(errorcodes.FOREIGN_KEY_VIOLATION, 'car_customer_id_fkey')) == \
+        'foreign_key_violation'
+
+
+def test_delete_of_missing_row_is_not_found(fake_db):
+    state = SharedState(10)
+    state.refresh('customer_ids', [5, 6])
+    db = fake_db()
+    db.cursor.rowcount = 0
+    delete = load_test.OPERATIONS['delete_customer']
+    while state.customer_ids:
+        assert delete(db, state, random.Random(0)) == NOT_FOUND
+    db.cursor.rowcount = 1
+    state.refresh('customer_ids', [7])
+    assert delete(db, state, random.Random(0)) is True
+    assert state.customer_ids == []
+
+
+def test_run_clerk_records_connection_lost(fake_db, monkeypatch):
+    def add_customer(self, first_name, last_name, email):
+        self.conn.closed = 1
+        raise InterfaceError("connection already closed")
+
+    monkeypatch.setattr(fake_db, 'add_customer', add_customer, raising=False)
+    stats = ClerkStats()
+    run_clerk(SharedState(10), {'add_customer': 1}, random.Random(0),
+              threading.Event(), threading.Barrier(1), stats)
+    assert stats.failures['add_customer']['connection_lost'] == 1
+    assert stats.exited_early
+
+
+def test_cleanup_reports_failed_delete(fake_db, monkeypatch):
+    monkeypatch.setattr(fake_db, 'query_results', [True, False])
+    assert cleanup() is False
+    monkeypatch.setattr(fake_db, 'query_results', [True, True])
+    assert cleanup() is True
+
+
+def test_soak_cars_are_identified_by_owner(fake_db, monkeypatch):
+    monkeypatch.setattr(fake_db, 'customers', [
+        (1, 'Soak', 'Customer1', 'customer1.abc@soak.test'),
+        (2, 'Real', 'Owner', 'owner@example.com'),
+    ])
+    monkeypatch.setattr(fake_db, 'cars', [
+        (10, 'Model', 'Soak', 'SOAK1234ABCD', 1),
+        # A real Sikkim plate must never be treated as soak data
+        (11, 'Swift', 'Maruti', 'SK01AB1234', 2),
+    ])
+    state = SharedState(10)
+    db = fake_db()
+    load_customer_ids(db, state)
+    load_car_ids(db, state)
+    assert state.customer_ids == [1]
+    assert state.car_ids == [10]
+
+
+def test_pool_refresher_fills_pools_without_reads_in_mix(fake_db, monkeypatch):
+    monkeypatch.setattr(fake_db, 'customers', [(1, 'Soak', 'Customer1', 'customer1.abc@soak.test')])
+    monkeypatch.setattr(fake_db, 'cars', [(10, 'Model', 'Soak', 'SOAK1234ABCD', 1)])
+    monkeypatch.setattr(fake_db, 'staff', [(3, 'Soak', 'Staff1', 'Clerk', 'staff1.abc@soak.test')])
+    state = SharedState(10)
+    PoolRefresher(state, 1.0).refresh()
+    assert (state.customer_ids, state.car_ids, state.staff_ids) == ([1], [10], [3])